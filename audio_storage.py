@@ -0,0 +1,164 @@
+# audio_storage.py
+import argparse
+import os
+import sqlite3
+import time
+from hashlib import sha1
+from pathlib import Path
+
+DB_PATH = "database.db"
+
+# Files live at <singer folder>/<aa>/<bb>/<file>.mp3 where aa/bb come from a hash
+# of the file name, so no directory grows past a few hundred entries.
+MIGRATE_BATCH_SIZE = 500
+
+
+def _shard(filename):
+    h = sha1(filename.encode("utf-8")).hexdigest()
+    return h[:2], h[2:4]
+
+
+def sharded_path(folder, filename):
+    a, b = _shard(filename)
+    return Path(folder) / a / b / filename
+
+
+def is_sharded(file_path):
+    p = Path(file_path)
+    a, b = _shard(p.name)
+    return p.parent.name == b and p.parent.parent.name == a
+
+
+def iter_audio_files(folder, suffix=".mp3"):
+    """
+    Yields every audio file under a singer folder: the sharded tree plus any
+    files still in the legacy flat layout.
+    """
+    folder = Path(folder)
+    if not folder.is_dir():
+        return
+    with os.scandir(folder) as top:
+        for entry in top:
+            if entry.is_file() and entry.name.endswith(suffix):
+                yield folder / entry.name
+            elif entry.is_dir() and len(entry.name) == 2:
+                with os.scandir(entry.path) as level1:
+                    for sub in level1:
+                        if not (sub.is_dir() and len(sub.name) == 2):
+                            continue
+                        with os.scandir(sub.path) as level2:
+                            for f in level2:
+                                if f.is_file() and f.name.endswith(suffix):
+                                    yield folder / entry.name / sub.name / f.name
+
+
+def resolve_song_path(file_path):
+    """
+    Returns where a song's file really is: `file_path` itself, or its sharded
+    location when the file was moved but the row still holds the flat path
+    (mid-migration, or after restoring a pre-migration snapshot).
+    """
+    if not file_path or os.path.exists(file_path) or is_sharded(file_path):
+        return file_path
+    p = Path(file_path)
+    new = sharded_path(p.parent, p.name)
+    return str(new) if new.exists() else file_path
+
+
+def new_song_path(folder, filename):
+    """Returns a free sharded path for a new file, adding a suffix on name clashes."""
+    dest_path = sharded_path(folder, filename)
+    if dest_path.exists() or Path(folder, filename).exists():
+        stem = Path(filename).stem
+        suffix = Path(filename).suffix
+        dest_path = sharded_path(folder, f"{stem}_{int(time.time())}{suffix}")
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    return dest_path
+
+
+def migrate_to_sharded(db_path=DB_PATH, batch_size=MIGRATE_BATCH_SIZE, on_batch=None):
+    """
+    Moves flat-layout songs into the sharded tree and rewrites songs.file_path,
+    one transaction per batch. Safe to re-run after an interruption: rows whose
+    file already sits at its sharded path are just repointed.
+    `on_batch`, if given, is called with {old_path: new_path} after each commit.
+    Returns ({old_path: new_path} for rewritten rows, [(song_id, path)] skipped
+    because neither the flat nor the sharded file exists).
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("SELECT id, file_path FROM songs")
+    rows = [(song_id, fp) for song_id, fp in cur.fetchall() if fp and not is_sharded(fp)]
+
+    moved = {}
+    skipped = []
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        done = []
+        renamed = []
+        try:
+            for song_id, old_path in batch:
+                old = Path(old_path)
+                new = sharded_path(old.parent, old.name)
+                if not new.exists():
+                    if not old.exists():
+                        skipped.append((song_id, old_path))
+                        continue
+                    new.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(old, new)
+                    renamed.append((old_path, str(new)))
+                done.append((song_id, old_path, str(new)))
+            cur.executemany("UPDATE songs SET file_path=? WHERE id=?", [(new, song_id) for song_id, _, new in done])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # put files back so the rows still point at them
+            for old_path, new_path in renamed:
+                if os.path.exists(new_path):
+                    os.replace(new_path, old_path)
+            conn.close()
+            raise
+        batch_moved = {old_path: new_path for _, old_path, new_path in done}
+        moved.update(batch_moved)
+        if on_batch and batch_moved:
+            on_batch(batch_moved)
+
+    conn.close()
+    return moved, skipped
+
+
+def repoint_moved_songs(db_path=DB_PATH):
+    """
+    Rewrites flat songs.file_path rows whose file only exists in the sharded
+    tree, e.g. after restoring a snapshot taken before migration. Moves nothing.
+    Returns the number of rows updated.
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("SELECT id, file_path FROM songs")
+    updates = []
+    for song_id, file_path in cur.fetchall():
+        resolved = resolve_song_path(file_path)
+        if resolved != file_path:
+            updates.append((resolved, song_id))
+    cur.executemany("UPDATE songs SET file_path=? WHERE id=?", updates)
+    conn.commit()
+    conn.close()
+    return len(updates)
+
+
+if __name__ == "__main__":
+    from preview_clips import rename_previews
+
+    parser = argparse.ArgumentParser(description="Manage the sharded audio storage layout.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_migrate = sub.add_parser("migrate", help="move flat audio/<singer>/ files into the sharded tree")
+    p_migrate.add_argument("--batch-size", type=int, default=MIGRATE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        # re-key previews per batch so an error in a later batch orphans none
+        moved, skipped = migrate_to_sharded(batch_size=args.batch_size, on_batch=rename_previews)
+        print(f"✅ Moved {len(moved)} songs into the sharded layout.")
+        for song_id, path in skipped:
+            print(f"⚠️ Song {song_id}: {path} not found (flat or sharded); left unchanged.")
@@ -0,0 +1,199 @@
+# backup_database.py
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DB_PATH = "database.db"
+BACKUP_DIR = "backups"
+
+# Copy this many pages per step and pause between steps so live sessions
+# (favorites, uploads) can grab the write lock while a backup is running.
+BACKUP_PAGES_PER_STEP = 64
+BACKUP_STEP_SLEEP = 0.05
+
+# How many database copies and snapshots the scheduler keeps (each).
+BACKUP_KEEP = 8
+
+SNAPSHOT_TABLES = ("songs", "favorites")
+
+
+def _timestamp():
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+def backup_db(dest_path=None, src_path=DB_PATH, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """
+    Copies the live database with SQLite's online backup API, a few pages at a time.
+    Returns the path of the backup file.
+    """
+    if dest_path is None:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        dest_path = os.path.join(BACKUP_DIR, f"database_{_timestamp()}.db")
+    tmp_path = f"{dest_path}.part"
+
+    try:
+        src = sqlite3.connect(src_path, check_same_thread=False)
+        dest = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dest, pages=pages, sleep=sleep)
+        finally:
+            dest.close()
+            src.close()
+        # only expose the backup once it is complete
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return dest_path
+
+
+def _table_columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+
+def export_snapshot(dest_path=None, src_path=DB_PATH):
+    """
+    Writes a gzip-compressed JSON snapshot of the catalogue and favorites.
+    Returns the path of the snapshot file.
+    """
+    if dest_path is None:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        dest_path = os.path.join(BACKUP_DIR, f"snapshot_{_timestamp()}.json.gz")
+
+    conn = sqlite3.connect(src_path, check_same_thread=False)
+    cur = conn.cursor()
+    snapshot = {
+        "version": 2,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    # read both tables in a single transaction so the snapshot is consistent
+    cur.execute("BEGIN")
+    for table in SNAPSHOT_TABLES:
+        columns = _table_columns(cur, table)
+        cur.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+        snapshot[table] = {"columns": columns, "rows": cur.fetchall()}
+    conn.rollback()
+    conn.close()
+
+    tmp_path = f"{dest_path}.part"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return dest_path
+
+
+def restore_snapshot(snapshot_path, dest_path=DB_PATH):
+    """
+    Replaces the catalogue and favorites in the database with the rows from a snapshot.
+    The tables must already exist (start the app once, or run create_database.py).
+    Returns (number of songs, number of favorites) restored.
+    """
+    with gzip.open(snapshot_path, "rt", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    conn = sqlite3.connect(dest_path, check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    missing = set(SNAPSHOT_TABLES) - {row[0] for row in cur.fetchall()}
+    if missing:
+        conn.close()
+        raise RuntimeError(f"{dest_path} has no {', '.join(sorted(missing))} table; create the schema before restoring.")
+    # one transaction, bulk inserts
+    cur.execute("DELETE FROM favorites")
+    cur.execute("DELETE FROM songs")
+    counts = []
+    for table in SNAPSHOT_TABLES:
+        columns, rows = snapshot[table]["columns"], snapshot[table]["rows"]
+        # keep only columns the target table has, e.g. favorites.added_at
+        target = set(_table_columns(cur, table))
+        keep = [i for i, col in enumerate(columns) if col in target]
+        names = ", ".join(columns[i] for i in keep)
+        placeholders = ", ".join("?" * len(keep))
+        cur.executemany(
+            f"INSERT INTO {table} ({names}) VALUES ({placeholders})",
+            [tuple(row[i] for i in keep) for row in rows],
+        )
+        counts.append(len(rows))
+    conn.commit()
+    conn.close()
+    return tuple(counts)
+
+
+def prune_backups(keep=BACKUP_KEEP, backup_dir=BACKUP_DIR):
+    """Deletes all but the newest `keep` database copies and snapshots."""
+    if not os.path.isdir(backup_dir):
+        return
+    for prefix in ("database_", "snapshot_"):
+        # timestamped names sort chronologically
+        names = sorted(n for n in os.listdir(backup_dir) if n.startswith(prefix) and not n.endswith(".part"))
+        for name in names[:-keep] if keep > 0 else names:
+            os.remove(os.path.join(backup_dir, name))
+
+
+def start_backup_scheduler(interval_seconds=6 * 60 * 60, with_snapshot=False, keep=BACKUP_KEEP):
+    """
+    Starts a daemon thread that backs up the database every `interval_seconds`,
+    keeping the newest `keep` copies. Returns the thread.
+    """
+
+    def _run():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                backup_db()
+                if with_snapshot:
+                    export_snapshot()
+                prune_backups(keep)
+            except Exception as e:
+                print(f"⚠️ Scheduled backup failed: {e}")
+
+    thread = threading.Thread(target=_run, name="soulfood-backup", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up, export or restore database.db without stopping the app.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_backup = sub.add_parser("backup", help="online copy of database.db")
+    p_backup.add_argument("--dest", help="backup file path (default backups/database_<time>.db)")
+    p_backup.add_argument("--snapshot", action="store_true", help="also write a compressed snapshot")
+    p_backup.add_argument("--keep", type=int, help="prune to the newest N backups afterwards")
+
+    p_export = sub.add_parser("export", help="write a compressed snapshot of songs and favorites")
+    p_export.add_argument("--dest", help="snapshot file path (default backups/snapshot_<time>.json.gz)")
+
+    p_restore = sub.add_parser("restore", help="restore songs and favorites from a snapshot")
+    p_restore.add_argument("snapshot", help="snapshot file (.json.gz)")
+
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        print(f"✅ Backup written to {backup_db(args.dest)}")
+        if args.snapshot:
+            print(f"✅ Snapshot written to {export_snapshot()}")
+        if args.keep is not None:
+            prune_backups(args.keep)
+    elif args.command == "export":
+        print(f"✅ Snapshot written to {export_snapshot(args.dest)}")
+    elif args.command == "restore":
+        try:
+            n_songs, n_favs = restore_snapshot(args.snapshot)
+        except RuntimeError as e:
+            raise SystemExit(f"⚠️ {e}")
+        print(f"✅ Restored {n_songs} songs and {n_favs} favorites from {args.snapshot}")
+        # a snapshot taken before `audio_storage.py migrate` still holds flat paths
+        from audio_storage import repoint_moved_songs
+
+        n_repointed = repoint_moved_songs()
+        if n_repointed:
+            print(f"✅ Repointed {n_repointed} songs to their sharded files")
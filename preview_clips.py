@@ -0,0 +1,261 @@
+# preview_clips.py
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+
+DB_PATH = "database.db"
+PREVIEW_DIR = "previews"
+
+# Clips start a little into the song (past most intros) and are small enough
+# to start playing almost immediately on a phone connection.
+PREVIEW_OFFSET = 30
+PREVIEW_DURATION = 18
+PREVIEW_BITRATE = "48k"
+PREVIEW_WORKERS = 2
+# anything smaller is a header-only file, e.g. from seeking past the end
+MIN_CLIP_BYTES = 2048
+# Finished clips are written to the index in batches: every commit to
+# database.db invalidates the app's query cache.
+PREVIEW_FLUSH_SIZE = 100
+PREVIEW_FLUSH_SECONDS = 30
+
+_pending_lock = threading.Lock()
+_pending = set()
+_finished = []
+_last_flush = time.monotonic()
+_executor = None
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def _get_conn(db_path=DB_PATH):
+    return sqlite3.connect(db_path, check_same_thread=False)
+
+
+def create_preview_table(db_path=DB_PATH):
+    """
+    The index lives in the app database so the app, the preview CLI and the
+    storage migration can all update it safely at the same time.
+    """
+    conn = _get_conn(db_path)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS previews (
+            file_path TEXT PRIMARY KEY,
+            clip TEXT,
+            source_mtime INTEGER,
+            source_size INTEGER
+        )
+    """
+    )
+    conn.commit()
+    conn.close()
+
+
+def _source_stamp(file_path):
+    st = os.stat(file_path)
+    return int(st.st_mtime), st.st_size
+
+
+def _clip_path(file_path):
+    name = sha1(file_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(PREVIEW_DIR, f"{name}.mp3")
+
+
+def load_index(db_path=DB_PATH):
+    """Returns {file_path: (clip, source_mtime, source_size)}."""
+    create_preview_table(db_path)
+    conn = _get_conn(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT file_path, clip, source_mtime, source_size FROM previews")
+    index = {row[0]: row[1:] for row in cur.fetchall()}
+    conn.close()
+    return index
+
+
+def _save_entries(entries, db_path=DB_PATH):
+    """Upserts [(file_path, clip)] into the index in one transaction."""
+    rows = []
+    for file_path, clip in entries:
+        try:
+            rows.append((file_path, clip, *_source_stamp(file_path)))
+        except OSError:
+            continue
+    if not rows:
+        return
+    conn = _get_conn(db_path)
+    conn.executemany(
+        "INSERT OR REPLACE INTO previews (file_path, clip, source_mtime, source_size) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def _probe_duration(src):
+    if shutil.which("ffprobe") is None:
+        return None
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", src,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def cut_clip(src, dest, offset=PREVIEW_OFFSET, duration=PREVIEW_DURATION, bitrate=PREVIEW_BITRATE):
+    """
+    Cuts a mono, low-bitrate mp3 preview out of `src` with ffmpeg.
+    Short songs start earlier so the clip still holds `duration` seconds of audio.
+    Returns True if a clip was written.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.part.mp3"
+    length = _probe_duration(src)
+    if length is None:
+        starts = (offset, 0)
+    else:
+        starts = (min(offset, max(0, length - duration)),)
+    try:
+        for start in starts:
+            cmd = [
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-ss", str(start), "-t", str(duration), "-i", src,
+                "-vn", "-ac", "1", "-b:a", bitrate, tmp_path,
+            ]
+            result = subprocess.run(cmd, capture_output=True)
+            if result.returncode == 0 and os.path.exists(tmp_path) and os.path.getsize(tmp_path) >= MIN_CLIP_BYTES:
+                os.replace(tmp_path, dest)
+                return True
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _needs_preview(file_path, index):
+    if not os.path.exists(file_path):
+        return False
+    entry = index.get(file_path)
+    if not entry or not os.path.exists(entry[0]):
+        return True
+    return tuple(entry[1:]) != _source_stamp(file_path)
+
+
+def _new_pool():
+    # spawn, not fork: the Streamlit server is multi-threaded and forking it
+    # can leave workers stuck on locks held by other threads
+    return ProcessPoolExecutor(max_workers=PREVIEW_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _record(file_path, clip, ok):
+    global _last_flush
+    with _pending_lock:
+        # finished clips stay pending until they are in the index, so they
+        # are not queued a second time in between
+        if ok:
+            _finished.append((file_path, clip))
+        else:
+            _pending.discard(file_path)
+        due = _finished and (
+            len(_finished) == len(_pending)
+            or len(_finished) >= PREVIEW_FLUSH_SIZE
+            or time.monotonic() - _last_flush >= PREVIEW_FLUSH_SECONDS
+        )
+        if not due:
+            return
+        entries = _finished[:]
+        _finished.clear()
+        _last_flush = time.monotonic()
+    try:
+        _save_entries(entries)
+    finally:
+        with _pending_lock:
+            _pending.difference_update(file_path for file_path, _ in entries)
+
+
+def schedule_previews(file_paths):
+    """
+    Queues preview generation for the given songs on a background process pool.
+    Returns immediately; songs that already have a fresh clip are skipped.
+    """
+    global _executor
+    if not ffmpeg_available():
+        return 0
+
+    index = load_index()
+    with _pending_lock:
+        todo = [p for p in file_paths if p not in _pending and _needs_preview(p, index)]
+        _pending.update(todo)
+        if todo and _executor is None:
+            _executor = _new_pool()
+
+    for file_path in todo:
+        clip = _clip_path(file_path)
+        future = _executor.submit(cut_clip, file_path, clip)
+        future.add_done_callback(
+            lambda f, file_path=file_path, clip=clip: _record(file_path, clip, not f.exception() and f.result())
+        )
+    return len(todo)
+
+
+def remove_preview(file_path):
+    conn = _get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT clip FROM previews WHERE file_path=?", (file_path,))
+    row = cur.fetchone()
+    if row is None:
+        conn.close()
+        return
+    cur.execute("DELETE FROM previews WHERE file_path=?", (file_path,))
+    conn.commit()
+    conn.close()
+    if os.path.exists(row[0]):
+        os.remove(row[0])
+
+
+def rename_previews(moved, db_path=DB_PATH):
+    """Re-keys index entries after songs were moved ({old_path: new_path})."""
+    if not moved:
+        return
+    create_preview_table(db_path)
+    conn = _get_conn(db_path)
+    conn.executemany(
+        "UPDATE OR REPLACE previews SET file_path=? WHERE file_path=?",
+        [(new_path, old_path) for old_path, new_path in moved.items()],
+    )
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    if not ffmpeg_available():
+        raise SystemExit("⚠️ ffmpeg not found on PATH; cannot build previews.")
+
+    conn = _get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT file_path FROM songs")
+    paths = [row[0] for row in cur.fetchall()]
+    conn.close()
+
+    index = load_index()
+    todo = [p for p in paths if _needs_preview(p, index)]
+    built = []
+    with _new_pool() as pool:
+        clips = [_clip_path(p) for p in todo]
+        for file_path, clip, ok in zip(todo, clips, pool.map(cut_clip, todo, clips)):
+            if ok:
+                built.append((file_path, clip))
+    _save_entries(built)
+    print(f"✅ Built {len(built)} preview clips into {PREVIEW_DIR}/")
@@ -5,7 +5,12 @@ import os
 import sqlite3
 import base64
 import time
+import threading
+from collections import OrderedDict
 from streamlit_autorefresh import st_autorefresh
+from audio_storage import is_sharded, iter_audio_files, new_song_path, resolve_song_path, sharded_path
+from backup_database import start_backup_scheduler
+from preview_clips import create_preview_table, remove_preview, schedule_previews
 
 # ---------------------- CONFIG ----------------------
 st.set_page_config(page_title="SoulFood 🎵", layout="wide", page_icon="🎶")
@@ -44,6 +49,153 @@ def create_tables():
     conn.close()
 
 
+# ---------------------- QUERY CACHE -----------------------
+class QueryCache:
+    """
+    Size-bounded LRU of catalogue query results shared by every session.
+    Entries are keyed by (sql, params, generation); bumping the generation on
+    each write makes every older entry unreachable, and the LRU evicts them.
+    Writes from other processes (backup restore, storage migration) are picked
+    up through SQLite's PRAGMA data_version on a long-lived connection, checked
+    at most once every `version_interval` seconds.
+    """
+
+    def __init__(self, max_entries=256, version_interval=1.0):
+        self.max_entries = max_entries
+        self.version_interval = version_interval
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # short timeout: if a writer holds the file, skip this check rather than wait
+        self._version_conn = sqlite3.connect(DB_PATH, timeout=0.05, check_same_thread=False)
+        self._version_lock = threading.Lock()
+        self._version_checked_at = time.monotonic()
+        self._data_version = self._read_data_version()
+
+    def _read_data_version(self):
+        # changes whenever any other connection commits to the database file
+        return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_external_writes(self):
+        if time.monotonic() - self._version_checked_at < self.version_interval:
+            return
+        # one thread checks; the others carry on with what is cached
+        if not self._version_lock.acquire(blocking=False):
+            return
+        try:
+            self._version_checked_at = time.monotonic()
+            try:
+                data_version = self._read_data_version()
+            except sqlite3.OperationalError:
+                return
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self.bump()
+        finally:
+            self._version_lock.release()
+
+    def fetchall(self, sql, params=()):
+        params = tuple(params)
+        self._check_external_writes()
+        with self._lock:
+            key = (sql, params, self.generation)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+            self.misses += 1
+
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        conn.close()
+
+        with self._lock:
+            # a write may have landed while we were reading; don't cache stale rows
+            if key[2] == self.generation:
+                self._entries[key] = rows
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return list(rows)
+
+    def bump(self):
+        with self._lock:
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+@st.cache_resource
+def get_query_cache():
+    # cache_resource keeps one cache per server process, shared across sessions
+    return QueryCache()
+
+
+def cached_query(sql, params=()):
+    return get_query_cache().fetchall(sql, params)
+
+
+def bump_catalogue_generation():
+    get_query_cache().bump()
+
+
+@st.cache_resource
+def init_database():
+    # run once per process so reruns don't hit SQLite just to check the schema
+    create_tables()
+    create_preview_table(DB_PATH)
+    return True
+
+
+# ---------------------- BACKUPS -----------------------
+BACKUP_INTERVAL_SECONDS = 6 * 60 * 60
+
+
+@st.cache_resource
+def start_backups():
+    # cache_resource keeps a single backup thread per server process, not per session
+    return start_backup_scheduler(BACKUP_INTERVAL_SECONDS, with_snapshot=True)
+
+
+# ---------------------- PREVIEWS -----------------------
+@st.cache_resource
+def start_previews():
+    # once per process: queue clips for songs ingested before previews existed
+    return schedule_previews([row[0] for row in cached_query("SELECT file_path FROM songs")])
+
+
+def get_preview_clips(singer_key):
+    return dict(
+        cached_query(
+            "SELECT p.file_path, p.clip FROM previews p JOIN songs s ON s.file_path=p.file_path WHERE s.singer=?",
+            (singer_key,),
+        )
+    )
+
+
+@st.fragment
+def show_preview(song_id, file_path, clip):
+    # a fragment, so toggling a preview reruns only this row; the clip is
+    # only read and sent once the listener asks for it
+    if st.toggle("🎧 Preview", key=f"preview_{song_id}"):
+        if os.path.exists(clip):
+            st.audio(clip, format="audio/mp3", autoplay=True)
+        else:
+            schedule_previews([resolve_song_path(file_path)])
+            st.caption("Preview not ready yet.")
+
+
 # ---------------------- DATA -----------------------
 SINGERS = {
     "arnest_mall": {
@@ -79,27 +231,36 @@ BIBLE_VERSES = [
 # ---------------------- AUTO SYNC ------------------
 def auto_sync_songs():
     """
-    Scans singer folders for .mp3 files and inserts them into the songs table if missing.
+    Scans singer folders (sharded tree and legacy flat layout) for .mp3 files and
+    inserts them into the songs table if missing.
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT file_path FROM songs")
-    existing_files = {row[0] for row in cur.fetchall()}
+    existing_files = {row[0] for row in cached_query("SELECT file_path FROM songs")}
 
+    new_rows = []
     for key, data in SINGERS.items():
         folder = Path(data["folder"])
         folder.mkdir(parents=True, exist_ok=True)
-        for file in folder.glob("*.mp3"):
+        for file in iter_audio_files(folder):
             # normalize path string
             file_str = str(file)
-            if file_str not in existing_files:
-                title = file.stem.replace("_", " ").title()
-                cur.execute(
-                    "INSERT INTO songs (singer, title, file_path) VALUES (?, ?, ?)",
-                    (key, title, file_str),
-                )
+            if file_str in existing_files:
+                continue
+            # the same song under its other layout (mid-migration) is not new
+            other_path = str(folder / file.name) if is_sharded(file) else str(sharded_path(folder, file.name))
+            if other_path in existing_files:
+                continue
+            title = file.stem.replace("_", " ").title()
+            new_rows.append((key, title, file_str))
+
+    if not new_rows:
+        return
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO songs (singer, title, file_path) VALUES (?, ?, ?)", new_rows)
     conn.commit()
     conn.close()
+    bump_catalogue_generation()
+    schedule_previews([row[2] for row in new_rows])
 
 
 # ---------------------- UTILS ----------------------
@@ -116,21 +277,11 @@ def image_to_base64(image_path):
 
 
 def get_songs_by_singer(singer_key):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, title, file_path FROM songs WHERE singer=?", (singer_key,))
-    songs = cur.fetchall()
-    conn.close()
-    return songs
+    return cached_query("SELECT id, title, file_path FROM songs WHERE singer=?", (singer_key,))
 
 
 def get_favorites():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT song_id FROM favorites")
-    fav_ids = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return fav_ids
+    return [row[0] for row in cached_query("SELECT song_id FROM favorites")]
 
 
 def toggle_favorite(song_id):
@@ -146,6 +297,7 @@ def toggle_favorite(song_id):
         msg = "❤️ Added to favorites"
     conn.commit()
     conn.close()
+    bump_catalogue_generation()
     try:
         st.toast(msg)
     except Exception:
@@ -159,15 +311,23 @@ def delete_song(song_id):
     file_path_row = cur.fetchone()
     if file_path_row:
         file_path = file_path_row[0]
-        if file_path and os.path.exists(file_path):
+        # the file may have moved into the sharded tree while the row kept the flat path
+        real_path = resolve_song_path(file_path)
+        if real_path and os.path.exists(real_path):
+            try:
+                os.remove(real_path)
+            except Exception:
+                pass
+        for path in {file_path, real_path} - {None, ""}:
             try:
-                os.remove(file_path)
+                remove_preview(path)
             except Exception:
                 pass
     cur.execute("DELETE FROM songs WHERE id=?", (song_id,))
     cur.execute("DELETE FROM favorites WHERE song_id=?", (song_id,))
     conn.commit()
     conn.close()
+    bump_catalogue_generation()
     st.success("🗑️ Song deleted successfully!")
     if st.session_state.get("playing_song") == song_id:
         st.session_state["playing_song"] = None
@@ -358,14 +518,11 @@ def show_sticky_player_if_playing():
     if not playing_id:
         return
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT title, file_path FROM songs WHERE id=?", (playing_id,))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
+    rows = cached_query("SELECT title, file_path FROM songs WHERE id=?", (playing_id,))
+    if not rows:
         return
-    title, file_path = row
+    title, file_path = rows[0]
+    file_path = resolve_song_path(file_path)
     if not file_path or not os.path.exists(file_path):
         st.warning("⚠️ Playing file missing.")
         return
@@ -426,6 +583,7 @@ def show_songs(singer_key):
     show_header()
     songs = get_songs_by_singer(singer_key)
     fav_ids = get_favorites()
+    preview_clips = get_preview_clips(singer_key)
 
     st.markdown(f"<div style='font-weight:800; font-size:18px; margin-bottom:6px;'>{SINGERS[singer_key]['name']}</div>", unsafe_allow_html=True)
 
@@ -479,6 +637,11 @@ def show_songs(singer_key):
             if st.button("🗑️", key=f"del_{song_id}"):
                 delete_song(song_id)
 
+        # Short preview clip instead of the full track
+        clip = preview_clips.get(file_path)
+        if clip and st.session_state.get("playing_song") != song_id:
+            show_preview(song_id, file_path, clip)
+
         st.markdown("</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -493,12 +656,8 @@ def show_favorites_view():
         st.info("No favorites yet! Add some songs you love ❤️")
         return
 
-    conn = get_conn()
-    cur = conn.cursor()
     placeholders = ",".join(["?"] * len(fav_ids))
-    cur.execute(f"SELECT id, title, file_path, singer FROM (SELECT id, title, file_path, singer FROM songs) WHERE id IN ({placeholders})", fav_ids)
-    favs = cur.fetchall()
-    conn.close()
+    favs = cached_query(f"SELECT id, title, file_path, singer FROM (SELECT id, title, file_path, singer FROM songs) WHERE id IN ({placeholders})", fav_ids)
 
     st.markdown("<div style='font-weight:800; font-size:18px; margin-bottom:6px;'>❤️ Favorites</div>", unsafe_allow_html=True)
 
@@ -530,6 +689,8 @@ def show_favorites_view():
 # Admin view (same upload form & add singer flow as original, moved into main admin sheet)
 def show_admin_sheet():
     st.markdown("<div style='display:flex; justify-content:space-between; align-items:center; margin-bottom:8px;'><div style='font-weight:800; font-size:18px;'>➕ Admin</div><div style='color:var(--muted); font-weight:700;'>Upload & Manage</div></div>", unsafe_allow_html=True)
+    stats = get_query_cache().stats()
+    st.caption(f"Query cache — hits: {stats['hits']} · misses: {stats['misses']} · entries: {stats['entries']} · generation: {stats['generation']}")
     with st.expander("➕ Add Singer (optional)", expanded=False):
         new_singer_key = st.text_input("Singer key (slug, e.g., john_doe)", key="admin_new_singer_key")
         new_singer_name = st.text_input("Singer name", key="admin_new_singer_name")
@@ -561,11 +722,7 @@ def show_admin_sheet():
                 dest_folder = Path(SINGERS[singer_choice]["folder"])
                 dest_folder.mkdir(parents=True, exist_ok=True)
                 safe_name = uploaded_file.name.replace(" ", "_")
-                dest_path = dest_folder / safe_name
-                if dest_path.exists():
-                    stem = dest_path.stem
-                    suffix = dest_path.suffix
-                    dest_path = dest_folder / f"{stem}_{int(time.time())}{suffix}"
+                dest_path = new_song_path(dest_folder, safe_name)
                 with open(dest_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
                 conn = get_conn()
@@ -573,6 +730,8 @@ def show_admin_sheet():
                 cur.execute("INSERT INTO songs (singer, title, file_path) VALUES (?, ?, ?)", (singer_choice, song_title, str(dest_path)))
                 conn.commit()
                 conn.close()
+                bump_catalogue_generation()
+                schedule_previews([str(dest_path)])
                 st.success(f"✅ Song '{song_title}' uploaded successfully!")
                 time.sleep(0.5)
                 auto_sync_songs()
@@ -580,8 +739,10 @@ def show_admin_sheet():
 
 
 # ---------------------- APP START ------------------
-create_tables()
+init_database()
 auto_sync_songs()
+start_backups()
+start_previews()
 
 # Initialize session states
 for k, v in {